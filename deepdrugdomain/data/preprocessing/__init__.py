@@ -1,5 +1,5 @@
 from .factory import PreprocessorFactory
-from .base_preprocessor import BasePreprocessor, AbstractBasePreprocessor
+from .base_preprocessor import BasePreprocessor, AbstractBasePreprocessor, ProcessedDataStore
 from .drug import *
 from .label import *
 from .protein import *
@@ -4,7 +4,8 @@ Data Preprocessing Utility
 
 This file contains classes and methods to handle preprocessing tasks for various data sources.
 It provides mechanisms to preprocessing data, shard the processed data, and save and load the preprocessed data from disk.
-Ray parallel processing is integrated to optimize the data processing speed.
+Ray parallel processing is integrated to optimize the data processing speed. Data that is not kept in memory is
+stored in a SQLite key to blob store and read back one record (or one batch) at a time.
 
 Example:
     >>> from deepdrugdomain.data.preprocessing import BasePreprocessor
@@ -23,9 +24,11 @@ Classes:
     - AbstractBasePreprocessor: An abstract base class for all preprocessors. Sets the methods and interfaces to be implemented.
     - BasePreprocessor: A basic preprocessor implementation that provides utility methods and interfaces to deal with data preprocessing tasks.
       Note: This class is not intended to be instantiated directly.
+    - ProcessedDataStore: An on-disk key to blob store holding the preprocessed data of one attribute.
 
 Utility Functions:
     - save_mapping: Saves a given mapping into a JSON file.
+    - save_invalid_keys: Saves the keys whose preprocessing failed into a JSON file.
 
 Dependencies:
     - pickle: For data serialization and deserialization.
@@ -33,15 +36,19 @@ Dependencies:
     - typing: For type hints.
     - os: Operating system interfaces, e.g., for file path operations.
     - json: To read and write JSON files.
+    - sqlite3: For the on-disk store of preprocessed data.
     - ray: For parallel processing.
     - tqdm: A progress bar utility.
 """
 
 import pickle
+import sqlite3
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Union, List, Optional
+from typing import Any, Callable, Dict, Iterable, Union, List, Optional, Tuple
 import os
 import json
+import tempfile
+import orjson
 import ray
 from tqdm import tqdm
 
@@ -240,6 +247,133 @@ def save_mapping(mapping: dict, filename: str) -> None:
         json.dump(mapping, f, ensure_ascii=False, indent=4)
 
 
+def save_invalid_keys(keys: List[Any], filename: str) -> None:
+    """
+    Save the keys whose preprocessing failed to a JSON file, so they can be dropped from
+    the dataset without scanning the preprocessed data.
+
+    Parameters:
+    - keys (List[Any]): The invalid keys.
+    - filename (str): The name of the file where the keys will be saved.
+
+    Returns:
+    - None
+    """
+    with open(filename, 'wb') as f:
+        f.write(orjson.dumps(list(keys)))
+
+
+class ProcessedDataStore:
+    """
+        Key to blob store, backed by SQLite, holding the preprocessed data of one attribute on disk.
+
+        Only the requested records are read, so memory usage does not grow with the size of the dataset.
+        Keys whose preprocessing failed are stored with a NULL blob and read back as None. The connection
+        is opened lazily in each process, so the store can be shipped to DataLoader workers.
+
+        Parameters:
+            path (str): Path of the SQLite file.
+            loads (Callable[[bytes], Any]): Function converting a stored blob back to the preprocessed data.
+    """
+
+    # SQLite limits the number of bound parameters of a single statement
+    _chunk_size = 900
+
+    def __init__(self, path: str, loads: Callable[[bytes], Any] = pickle.loads) -> None:
+        self.path = path
+        self.loads = loads
+        self._conn = None
+        self._pid = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        state['_pid'] = None
+        return state
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS data (key PRIMARY KEY, value BLOB)")
+            self._pid = os.getpid()
+        return self._conn
+
+    def _chunks(self, keys: List[Any]) -> Iterable[List[Any]]:
+        for start in range(0, len(keys), self._chunk_size):
+            yield keys[start:start + self._chunk_size]
+
+    def _select(self, keys: List[Any], columns: str) -> List[Tuple]:
+        rows = []
+        conn = self._connect()
+        for chunk in self._chunks(keys):
+            placeholders = ",".join("?" * len(chunk))
+            rows.extend(conn.execute(
+                f"SELECT {columns} FROM data WHERE key IN ({placeholders})", chunk))
+        return rows
+
+    def put_blobs(self, items: Iterable[Tuple[Any, Optional[bytes]]]) -> None:
+        """
+            Insert (key, blob) pairs in a single transaction. A None blob marks an invalid key.
+        """
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO data (key, value) VALUES (?, ?)", items)
+
+    def clear(self) -> None:
+        """
+            Remove all the records from the store.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM data")
+
+    def missing(self, keys: List[Any]) -> List[Any]:
+        """
+            Get the keys that are not in the store.
+        """
+        found = {row[0] for row in self._select(list(keys), "key")}
+        return [key for key in keys if key not in found]
+
+    def get_many(self, keys: List[Any]) -> List[Any]:
+        """
+            Fetch the preprocessed data of several keys with one query per chunk of keys.
+
+            Returns:
+                List[Any]: The preprocessed data, in the same order as `keys`.
+        """
+        keys = list(keys)
+        blobs = dict(self._select(list(set(keys)), "key, value"))
+        values = []
+        for key in keys:
+            if key not in blobs:
+                raise KeyError(key)
+            blob = blobs[key]
+            values.append(None if blob is None else self.loads(blob))
+        return values
+
+    def __getitem__(self, key: Any) -> Any:
+        row = self._connect().execute(
+            "SELECT value FROM data WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return None if row[0] is None else self.loads(row[0])
+
+    def __contains__(self, key: Any) -> bool:
+        return self._connect().execute(
+            "SELECT 1 FROM data WHERE key = ?", (key,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM data").fetchone()[0]
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = None
+        self._pid = None
+
+
 class BasePreprocessor(AbstractBasePreprocessor, ABC):
     """
         Base class for preprocessing data.
@@ -306,26 +440,19 @@ class BasePreprocessor(AbstractBasePreprocessor, ABC):
         return self.preprocess(data)
 
     @ray.remote
-    def _preprocess_and_save_data_point(self, data_point: Any, base_dir: str, idx: int, prefix: str) -> Optional[str]:
+    def _preprocess_to_blob(self, data_point: Any) -> Optional[bytes]:
         """
-           Preprocess a single data point and save it to disk using pickle.
+           Preprocess a single data point and serialize it for the on-disk store.
 
            Parameters:
                data_point (Any): The data point to preprocessing.
-               base_dir (str): Directory to save the preprocessed data.
-               idx (int): Index of the data point.
-               prefix (str): Prefix for the filename.
 
            Returns:
-               str or None: Path to the saved file or None if saving or preprocessing failed.
+               bytes or None: The serialized data or None if preprocessing failed.
         """
         processed = self.preprocess(data_point)
         if processed is not None:
-            # Assuming your save function accepts the base directory as a parameter
-            path = os.path.join(
-                base_dir, f"{prefix}_object_{idx}.bin")
-            self.save_data(processed, path)
-            return path
+            return self._value_to_blob(processed)
 
         return None
 
@@ -350,6 +477,56 @@ class BasePreprocessor(AbstractBasePreprocessor, ABC):
 
         return all_processed_data, invalid_results
 
+    def _process_in_memory(self, data: List[Any], num_threads: int):
+        """
+            Preprocess data items in parallel using Ray and keep the results in memory.
+            Derived classes can override this method to plug in a different batch strategy.
+
+            Parameters:
+                data (List[Any]): List of data items to process.
+                num_threads (int): Number of CPUs made available to Ray.
+
+            Returns:
+                tuple: A tuple containing all processed data and invalid results.
+        """
+        ray.init(logging_level=0, num_cpus=num_threads)
+        futures = {d: self._worker.remote(self, d) for d in data}
+        all_processed_data, invalid_results = self._process(futures, data)
+        ray.shutdown()
+
+        return all_processed_data, invalid_results
+
+    def _process_to_store(self, data: List[Any], store: ProcessedDataStore, num_threads: int,
+                          batch_size: int = 1024) -> List[Any]:
+        """
+            Preprocess data items in parallel using Ray and write them to the on-disk store.
+
+            Parameters:
+                data (List[Any]): List of data items to process.
+                store (ProcessedDataStore): The store the processed data is written to.
+                num_threads (int): Number of CPUs made available to Ray.
+                batch_size (int): Number of records written per transaction.
+
+            Returns:
+                List[Any]: The data items whose preprocessing failed.
+        """
+        ray.init(logging_level=0, num_cpus=num_threads)
+        futures = {d: self._preprocess_to_blob.remote(self, d) for d in data}
+        invalid_results = []
+        batch = []
+        for data_item in tqdm(futures, total=len(data), desc=f"Processing"):
+            blob = ray.get(futures[data_item])
+            if blob is None:
+                invalid_results.append(data_item)
+            batch.append((data_item, blob))
+            if len(batch) >= batch_size:
+                store.put_blobs(batch)
+                batch = []
+        store.put_blobs(batch)
+        ray.shutdown()
+
+        return invalid_results
+
     def process_and_get_info(self, data: List[Any], directory: str, in_memory: bool = True,
                              num_threads: int = 4, file_prefix: str = "", *args, **kwargs) -> Dict[Any, Any]:
         """
@@ -368,17 +545,15 @@ class BasePreprocessor(AbstractBasePreprocessor, ABC):
 
         """
         data = self.data_preparations(data)
-        ray.init(logging_level=0, num_cpus=num_threads)
         if in_memory:
-            futures = {d: self._worker.remote(self, d) for d in data}
-            all_processed_data, invalid_results = self._process(futures, data)
+            all_processed_data, invalid_results = self._process_in_memory(
+                data, num_threads)
             self.none = invalid_results
             mapping_info = self.generate_mapping(data)
             self.save_preprocessed_to_disk(
                 all_processed_data, directory, file_prefix)
             save_mapping(mapping_info, os.path.join(
                 directory, f"{file_prefix}_mapping_info.json"))
-            ray.shutdown()
             # Return the mapping info and the processed data
             return {
                 'mapping_info': mapping_info,
@@ -386,14 +561,13 @@ class BasePreprocessor(AbstractBasePreprocessor, ABC):
             }
 
         else:
-            futures = {d: self._preprocess_and_save_data_point.remote(
-                self, d, directory, idx, file_prefix) for idx, d in enumerate(data)}
-            all_processed_data, invalid_results = self._process(futures, data)
+            store = self.open_store(directory, file_prefix)
+            store.clear()
+            invalid_results = self._process_to_store(data, store, num_threads)
             self.none = invalid_results
-            save_mapping(all_processed_data,
-                         os.path.join(directory, f"{file_prefix}_mapping_info.json"))
-            ray.shutdown()
-            return {'mapping_info': all_processed_data}
+            save_invalid_keys(invalid_results, self.get_invalid_keys_path(
+                directory, file_prefix))
+            return {'mapping_info': store}
 
     def update(self, old_processed_data, old_mapping_data, data: List[Any], directory: str, in_memory: bool = True,
                num_threads: int = 4, file_prefix: str = "", *args, **kwargs) -> None:
@@ -401,10 +575,9 @@ class BasePreprocessor(AbstractBasePreprocessor, ABC):
               Process data and retrieve relevant information for newly added data.
         """
         data = self.data_preparations(data)
-        ray.init(logging_level=0, num_cpus=num_threads)
         if in_memory:
-            futures = {d: self._worker.remote(self, d) for d in data}
-            all_processed_data, invalid_results = self._process(futures, data)
+            all_processed_data, invalid_results = self._process_in_memory(
+                data, num_threads)
             self.none = invalid_results
             mapping_info = self.generate_mapping(data)
             mapping_info.update(old_mapping_data)
@@ -413,7 +586,6 @@ class BasePreprocessor(AbstractBasePreprocessor, ABC):
                 all_processed_data, directory, file_prefix)
             save_mapping(mapping_info, os.path.join(
                 directory, f"{file_prefix}_mapping_info.json"))
-            ray.shutdown()
             nones = []
             for item in mapping_info.keys():
                 if mapping_info[item] is None:
@@ -427,20 +599,13 @@ class BasePreprocessor(AbstractBasePreprocessor, ABC):
             }
 
         else:
-            idx_update = len(old_mapping_data)
-            futures = {d: self._preprocess_and_save_data_point.remote(
-                self, d, directory, idx + idx_update, file_prefix) for idx, d in enumerate(data)}
-            all_mapping_data, invalid_results = self._process(futures, data)
-            all_mapping_data.update(old_mapping_data)
-            save_mapping(all_mapping_data,
-                         os.path.join(directory, f"{file_prefix}_mapping_info.json"))
-            ray.shutdown()
-            nones = []
-            for item in all_mapping_data.keys():
-                if all_mapping_data[item] is None:
-                    nones.append(item)
-            self.none = nones
-            return {'mapping_info': all_mapping_data}
+            # The old mapping is the on-disk store; new records are appended to it
+            invalid_results = self._process_to_store(
+                data, old_mapping_data, num_threads)
+            self.none = list(self.none) + invalid_results
+            save_invalid_keys(self.none, self.get_invalid_keys_path(
+                directory, file_prefix))
+            return {'mapping_info': old_mapping_data}
 
     def generate_mapping(self, data: List[Any]) -> Dict[Any, Any]:
         """
@@ -492,6 +657,31 @@ class BasePreprocessor(AbstractBasePreprocessor, ABC):
 
         self.none = invalid_data
 
+    def save_vocab(self, directory: str, file_prefix: str) -> None:
+        """
+            Save any vocabulary the preprocessor builds while processing (e.g. token to id dictionaries),
+            so that ids stay stable across runs. By default, there is nothing to save.
+
+            Parameters:
+            - directory (str): Directory where the preprocessed data is saved.
+            - file_prefix (str): Prefix of the preprocessed data files.
+        """
+        pass
+
+    def load_vocab(self, directory: str, file_prefix: str) -> bool:
+        """
+            Load the vocabulary saved by `save_vocab`.
+
+            Parameters:
+            - directory (str): Directory where the preprocessed data is saved.
+            - file_prefix (str): Prefix of the preprocessed data files.
+
+            Returns:
+            - bool: False if the saved data was produced with a missing or different vocabulary and has
+                    to be processed again, True otherwise. By default, there is no vocabulary and True is returned.
+        """
+        return True
+
     def _serialize_key(self, data: Any) -> Any:
         """
         Convert the data (key) to a format suitable for saving.
@@ -548,6 +738,56 @@ class BasePreprocessor(AbstractBasePreprocessor, ABC):
         """
         return data
 
+    def _has_custom_data_format(self) -> bool:
+        return (type(self).save_data is not BasePreprocessor.save_data
+                or type(self).load_data is not BasePreprocessor.load_data)
+
+    def _value_to_blob(self, data: Any) -> bytes:
+        """
+        Convert the preprocessed data to the bytes kept in the on-disk store. If a derived class overrides
+        `save_data` or `load_data` (e.g. to use DGL's graph format), the blob is the content of the file
+        written by `save_data`; otherwise the data is pickled.
+
+        Parameters:
+        - data: The data to be stored.
+
+        Returns:
+        - bytes: The stored blob.
+        """
+        if not self._has_custom_data_format():
+            return pickle.dumps(self._serialize_value(data), protocol=pickle.HIGHEST_PROTOCOL)
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self.save_data(data, path)
+            with open(path, 'rb') as fp:
+                return fp.read()
+        finally:
+            os.remove(path)
+
+    def _blob_to_value(self, blob: bytes) -> Any:
+        """
+        Convert a blob from the on-disk store back to the preprocessed data, with `load_data` if a
+        derived class overrides `save_data` or `load_data` and with pickle otherwise.
+
+        Parameters:
+        - blob: The stored blob.
+
+        Returns:
+        - The preprocessed data.
+        """
+        if not self._has_custom_data_format():
+            return self._deserialize_value(pickle.loads(blob))
+
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(blob)
+            return self.load_data(path)
+        finally:
+            os.remove(path)
+
     def save_data(self, data: Any, path: str) -> None:
         """
         Save the data using pickle.
@@ -625,3 +865,56 @@ class BasePreprocessor(AbstractBasePreprocessor, ABC):
         file_name = f"{prefix}_all.pkl"
 
         return os.path.join(path, file_name)
+
+    def get_store_path(self, path: str, prefix: str) -> str:
+        """
+            Construct the path of the on-disk store of the preprocessed data.
+
+            Parameters:
+            - path: Base directory of the store.
+            - prefix: Prefix added to the filename.
+
+            Returns:
+            - str: Full path to the store.
+        """
+        return os.path.join(path, f"{prefix}_store.sqlite")
+
+    def get_invalid_keys_path(self, path: str, prefix: str) -> str:
+        """
+            Construct the path of the file listing the keys whose preprocessing failed.
+
+            Parameters:
+            - path: Base directory of the file.
+            - prefix: Prefix added to the filename.
+
+            Returns:
+            - str: Full path to the file.
+        """
+        return os.path.join(path, f"{prefix}_invalid_keys.json")
+
+    def open_store(self, path: str, prefix: str) -> ProcessedDataStore:
+        """
+            Open the on-disk store of the preprocessed data.
+
+            Parameters:
+            - path: Base directory of the store.
+            - prefix: Prefix added to the filename.
+
+            Returns:
+            - ProcessedDataStore: The store, decoding blobs with this preprocessor.
+        """
+        return ProcessedDataStore(self.get_store_path(path, prefix), self._blob_to_value)
+
+    def load_invalid_keys(self, path: str, prefix: str) -> List[Any]:
+        """
+            Load the keys whose preprocessing failed, saved along with the on-disk store.
+
+            Parameters:
+            - path: Base directory of the file.
+            - prefix: Prefix added to the filename.
+
+            Returns:
+            - List[Any]: The invalid keys.
+        """
+        with open(self.get_invalid_keys_path(path, prefix), 'rb') as fp:
+            return orjson.loads(fp.read())
@@ -1,3 +1,3 @@
 from .smile_to_dgl_graph import GraphFromSmilePreprocessor
-from .smile_fingerprint import FingerprintFromSmilePreprocessor
+from .smile_fingerprint import FingerprintFromSmilePreprocessor, unpack_fingerprint_bits
 from .smile_word_embedding import SmilesWordEmbeddingPreprocessor
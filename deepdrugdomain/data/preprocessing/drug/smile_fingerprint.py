@@ -6,6 +6,8 @@ Supported Fingerprinting Methods:
   Reference: RDKit: Open-source cheminformatics; http://www.rdkit.org
 - 'morgan': Morgan fingerprints (Circular fingerprints), equivalent to ECFP (Extended-Connectivity Fingerprints).
   Reference: Rogers, D., & Hahn, M. (2010). Extended-connectivity fingerprints. Journal of chemical information and modeling, 50(5), 742-754.
+- 'ecfp4': 2048-bit ECFP4 (Morgan, radius 2) computed with RDKit's fingerprint generator, a fast alternative to 'rdkit'.
+  Reference: Rogers, D., & Hahn, M. (2010). Extended-connectivity fingerprints. Journal of chemical information and modeling, 50(5), 742-754.
 - 'daylight': Daylight-like topological fingerprints, capturing molecular connectivity.
   Reference: Daylight Theory Manual; https://www.daylight.com/dayhtml/doc/theory/
 - 'ErG': Reduced graph fingerprint by RDKit, which provides a high-level abstracted representation of molecules.
@@ -27,6 +29,8 @@ Parameters:
 - atom_dict, bond_dict, fingerprint_dict, edge_dict (Optional[Dicts]): Custom dictionaries for the 'ammvf' method.
 - consider_hydrogen (bool): Whether to consider hydrogen atoms in the fingerprint.
 - custom_fingerprint (Optional[Callable]): A custom function for fingerprint generation.
+- pack_bits (bool): Whether to return 'rdkit' fingerprints bit-packed into a uint8 tensor.
+- cache_size (int): Number of fingerprints kept in the least-recently-used cache.
 
 The class inherits from `BasePreprocessor`, and its main functionality is implemented in the `preprocess` method, which takes a SMILES string and returns a fingerprint as a torch tensor.
 
@@ -37,23 +41,56 @@ Example usage:
 """
 
 
-from collections import defaultdict
-from typing import Dict, Optional, List, Callable, Union
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, Optional, List, Callable, Tuple, Union
+import hashlib
+import json
+import math
+import os
+import threading
 from rdkit import Chem, DataStructs
 import torch
-from ..utils import calcPubChemFingerAll, rdNormalizedDescriptors, create_atoms, create_ij_bond_dict, extract_fingerprints
+from joblib import Parallel, delayed
+from tqdm import tqdm
+from ..utils import calcPubChemFingerAll, rdNormalizedDescriptors, create_atoms, create_ij_bond_dict, extract_fingerprints, get_wl_kernel
 from deepdrugdomain.utils.exceptions import MissingRequiredParameterError
 from ..factory import PreprocessorFactory
-from ..base_preprocessor import BasePreprocessor
+from ..base_preprocessor import BasePreprocessor, ProcessedDataStore
 import numpy as np
 from rdkit.Chem import AllChem
 from rdkit.Chem.Fingerprints import FingerprintMols
 from rdkit.Chem.rdReducedGraphs import GetErGFingerprint
+from rdkit.Chem.rdFingerprintGenerator import GetMorganGenerator
 
-AtomDictType = Dict[Union[str, tuple], int]
+AtomDictType = Dict[str, int]
 BondDictType = Dict[str, int]
 FingerprintDictType = Dict[Union[int, tuple], int]
 
+_DTYPE_HEADER_SIZE = 4
+# Methods whose output does not depend on the atom order, so every spelling of a molecule can share the
+# fingerprint cached under its canonical SMILES. 'ammvf' gives one id per atom in input order, and nothing is
+# known about 'custom'.
+_CANONICAL_METHODS = ('rdkit', 'morgan', 'ecfp4', 'daylight', 'ErG', 'rdkit2d', 'pubchem')
+_MISSING = object()
+_BIT_MASK = torch.tensor([1, 2, 4, 8, 16, 32, 64, 128], dtype=torch.uint8)
+
+
+def unpack_fingerprint_bits(packed: torch.Tensor, num_bits: Optional[int] = None) -> torch.Tensor:
+    """
+    Unpack a fingerprint produced with `pack_bits=True` back into one value per bit.
+
+    Parameters:
+    - packed (torch.Tensor): uint8 tensor of shape (..., num_bytes), least significant bit first.
+    - num_bits (Optional[int]): Number of bits to keep. Defaults to all `8 * num_bytes` bits.
+
+    Returns:
+    - torch.Tensor: uint8 tensor of shape (..., num_bits) holding 0 or 1.
+    """
+    bits = torch.bitwise_and(packed.unsqueeze(-1), _BIT_MASK.to(packed.device)).ne(0)
+    bits = bits.flatten(-2).to(torch.uint8)
+    return bits if num_bits is None else bits[..., :num_bits]
+
 
 @PreprocessorFactory.register("smile_to_fingerprint", "smile", "fingerprint")
 class FingerprintFromSmilePreprocessor(BasePreprocessor):
@@ -67,22 +104,30 @@ class FingerprintFromSmilePreprocessor(BasePreprocessor):
                  edge_dict: Optional[Dict] = None,
                  consider_hydrogen: bool = False,
                  custom_fingerprint: Optional[Callable] = None,
+                 pack_bits: bool = False,
+                 cache_size: int = 4096,
                  **kwargs):
         """
         Initialize the FingerprintFromSmilePreprocessor with specified parameters.
 
         Parameters:
         - method (str, default 'rdkit'): The fingerprinting method to be used. Supported methods include 'rdkit', 
-        'morgan', 'daylight', 'ErG', 'rdkit2d', 'pubchem', 'ammvf', and 'custom'.
+        'morgan', 'ecfp4', 'daylight', 'ErG', 'rdkit2d', 'pubchem', 'ammvf', and 'custom'.
         - radius (Optional[int], default 2): The radius for Morgan fingerprint calculation.
         - nBits (Optional[int], default 1024): The size of the bit vector for Morgan fingerprints.
         - num_finger (Optional[int], default 2048): The number of bits for Daylight-type fingerprints.
         - atom_dict (Optional[AtomDictType]): Custom dictionary mapping atom representations to integers for 'ammvf' method.
         - bond_dict (Optional[BondDictType]): Custom dictionary mapping bond types to integers for 'ammvf' method.
         - fingerprint_dict (Optional[FingerprintDictType]): Custom dictionary for mapping fingerprints to indices for 'ammvf' method.
-        - edge_dict (Optional[Dict]): Custom dictionary for edge representation for 'ammvf' method.
+        - edge_dict (Optional[Dict]): Custom dictionary for edge representation for 'ammvf' method. Kept for
+        API compatibility; edge labels are not looked up after the WL refinement, so it is no longer filled.
         - consider_hydrogen (bool, default False): Flag to determine if hydrogen atoms should be included in the molecule representation.
         - custom_fingerprint (Optional[Callable]): A custom function for fingerprint generation for 'custom' method.
+        - pack_bits (bool, default False): For the 'rdkit' method, pack the bit vector into a uint8 tensor
+        (8 bits per byte, least significant bit first) instead of one float32 per bit. Use `unpack_fingerprint_bits`
+        to recover the bits.
+        - cache_size (int, default 4096): Number of fingerprints kept in the least-recently-used cache, so that
+        repeated molecules are not recomputed. 0 disables the cache.
 
         This initializer sets up the preprocessor with the specified method and parameters, enabling various types of 
         molecular fingerprint generation from SMILES strings. The method chosen determines the type of fingerprint and 
@@ -103,6 +148,137 @@ class FingerprintFromSmilePreprocessor(BasePreprocessor):
         self.fingerprint_dict = fingerprint_dict
         self.edge_dict = edge_dict
         self.custom_fingerprint = custom_fingerprint
+        self.pack_bits = pack_bits
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._mfpgen = GetMorganGenerator(
+            radius=2, fpSize=2048) if method == 'ecfp4' else None
+        # The 'ammvf' refinement kernel is specialized on the radius once, here
+        self._wl_kernel = get_wl_kernel(radius) if method == 'ammvf' else None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # The fingerprint cache is local to each process and is not shipped to workers.
+        # RDKit fingerprint generators cannot be pickled and are rebuilt on first use,
+        # as is the compiled 'ammvf' kernel. Each copy gets its own cache lock.
+        state = self.__dict__.copy()
+        state['_cache'] = OrderedDict()
+        state['_cache_lock'] = None
+        state['_mfpgen'] = None
+        state['_wl_kernel'] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._cache_lock = threading.Lock()
+
+    def _cache_key(self, smiles: str) -> tuple:
+        return (self.method, self.radius, self.nBits, self.num_finger, self.consider_hydrogen, self.pack_bits,
+                smiles)
+
+    def _cache_get(self, key: tuple) -> Any:
+        # The cached fingerprint (None for an invalid molecule), or `_MISSING`
+        with self._cache_lock:
+            if key not in self._cache:
+                return _MISSING
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+    def _cache_put(self, key: tuple, fingerprints: Optional[torch.Tensor]) -> None:
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = fingerprints
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _init_vocab(self) -> None:
+        # Plain dicts, filled on a miss by the helpers, so the vocabulary can be pickled to workers
+        self.atom_dict = self.atom_dict if self.atom_dict is not None else {}
+        self.bond_dict = self.bond_dict if self.bond_dict is not None else {}
+        self.fingerprint_dict = self.fingerprint_dict if self.fingerprint_dict is not None else {}
+        self.edge_dict = self.edge_dict if self.edge_dict is not None else {}
+
+    def _vocab(self) -> Dict[str, Dict]:
+        return {'atom_dict': self.atom_dict, 'bond_dict': self.bond_dict,
+                'fingerprint_dict': self.fingerprint_dict, 'edge_dict': self.edge_dict}
+
+    @staticmethod
+    def _vocab_digest(vocab: Dict[str, Dict]) -> str:
+        serialized = json.dumps({name: sorted(d.items())
+                                for name, d in vocab.items()})
+        return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _vocab_path(directory: str, file_prefix: str) -> str:
+        return os.path.join(directory, f"{file_prefix}_ammvf_vocab.json")
+
+    def save_vocab(self, directory: str, file_prefix: str) -> None:
+        """
+        Save the 'ammvf' atom, bond, fingerprint and edge dictionaries, together with their digest,
+        to `{file_prefix}_ammvf_vocab.json` in `directory`.
+
+        Parameters:
+        - directory (str): Directory where the preprocessed data is saved.
+        - file_prefix (str): Prefix of the preprocessed data files.
+        """
+        if self.method != 'ammvf':
+            return
+
+        self._init_vocab()
+        vocab = self._vocab()
+        saved = {name: dict(d) for name, d in vocab.items()}
+        saved['digest'] = self._vocab_digest(vocab)
+        with open(self._vocab_path(directory, file_prefix), 'w') as f:
+            json.dump(saved, f, ensure_ascii=False)
+
+    def load_vocab(self, directory: str, file_prefix: str) -> bool:
+        """
+        Load the 'ammvf' dictionaries saved by `save_vocab`, so fingerprint ids are the same as in the saved data.
+
+        If the preprocessor already holds a vocabulary (passed in by the user or grown by earlier calls),
+        it is kept and only compared with the saved one.
+
+        Parameters:
+        - directory (str): Directory where the preprocessed data is saved.
+        - file_prefix (str): Prefix of the preprocessed data files.
+
+        Returns:
+        - bool: False if the vocabulary file is missing, corrupted, empty, or differs from the current vocabulary.
+        """
+        if self.method != 'ammvf':
+            return True
+
+        path = self._vocab_path(directory, file_prefix)
+        if not os.path.exists(path):
+            return False
+
+        with open(path, 'r') as f:
+            saved = json.load(f)
+
+        # JSON stores the integer keys of the fingerprint and edge dictionaries as strings.
+        vocab = {name: {(int(k) if name in ('fingerprint_dict', 'edge_dict') else k): v
+                        for k, v in saved[name].items()}
+                 for name in self._vocab()}
+        digest = self._vocab_digest(vocab)
+        if digest != saved['digest']:
+            return False
+
+        # Every valid molecule adds its atoms, so an empty vocabulary can not have produced the saved
+        # fingerprints (e.g. they were written by workers that each grew their own copy of it).
+        if len(vocab['atom_dict']) == 0:
+            return False
+
+        self._init_vocab()
+        current = self._vocab()
+        if any(len(d) > 0 for d in current.values()):
+            return self._vocab_digest(current) == digest
+
+        for name, d in current.items():
+            d.update(vocab[name])
+
+        return True
 
     def preprocess(self, smiles: str) -> Optional[torch.Tensor]:
         """
@@ -114,9 +290,13 @@ class FingerprintFromSmilePreprocessor(BasePreprocessor):
         Returns:
         - Optional[torch.Tensor]: A tensor representing the molecular fingerprint. None if an error occurs.
 
+        Results are cached per canonical SMILES (and fingerprint settings), so repeated molecules are
+        only parsed and fingerprinted once.
+
         Supported methods:
         - 'rdkit': RDKit fingerprint
         - 'morgan': Morgan fingerprint
+        - 'ecfp4': ECFP4 fingerprint from RDKit's Morgan generator
         - 'daylight': Daylight-type fingerprint
         - 'ErG': ErG fingerprint
         - 'rdkit2d': RDKit 2D normalized descriptors
@@ -124,16 +304,31 @@ class FingerprintFromSmilePreprocessor(BasePreprocessor):
         - 'ammvf': Custom fingerprint
         - 'custom': User-defined custom fingerprint function
         """
-        valid_methods = ['rdkit', 'morgan', 'daylight',
+        valid_methods = ['rdkit', 'morgan', 'ecfp4', 'daylight',
                          'ErG', 'rdkit2d', 'pubchem', 'ammvf', 'custom']
         if self.method not in valid_methods:
             raise ValueError(
                 f"Invalid method specified. Choose from {valid_methods}.")
 
-        mol = Chem.MolFromSmiles(smiles)
+        key = self._cache_key(smiles)
+        fingerprints = self._cache_get(key)
+        if fingerprints is not _MISSING:
+            return fingerprints
+
+        return self._preprocess_mol(smiles, key, Chem.MolFromSmiles(smiles))
+
+    def _preprocess_mol(self, smiles: str, key: tuple, mol: Optional[Chem.Mol]) -> Optional[torch.Tensor]:
+        # Fingerprint of `smiles` from its parsed molecule, stored in the cache under `key`
         if mol is None:
+            self._cache_put(key, None)
             return None
 
+        canonical_key = self._cache_key(Chem.MolToSmiles(mol)) if self.method in _CANONICAL_METHODS else key
+        fingerprints = self._cache_get(canonical_key)
+        if fingerprints is not _MISSING:
+            self._cache_put(key, fingerprints)
+            return fingerprints
+
         if self.consider_hydrogen:
             mol = Chem.AddHs(mol)
 
@@ -141,7 +336,15 @@ class FingerprintFromSmilePreprocessor(BasePreprocessor):
 
         try:
             if self.method == 'rdkit':
-                fingerprints = Chem.RDKFingerprint(mol)
+                features_vec = Chem.RDKFingerprint(mol)
+                dtype = np.uint8 if self.pack_bits else np.float32
+                fingerprints = np.empty(
+                    features_vec.GetNumBits(), dtype=dtype)
+                DataStructs.ConvertToNumpyArray(features_vec, fingerprints)
+                if self.pack_bits:
+                    fingerprints = np.packbits(
+                        fingerprints, bitorder='little')
+                fingerprints = torch.from_numpy(fingerprints)
 
             elif self.method == 'morgan':
                 features_vec = AllChem.GetMorganFingerprintAsBitVect(
@@ -149,6 +352,12 @@ class FingerprintFromSmilePreprocessor(BasePreprocessor):
                 fingerprints = np.zeros((1,))
                 DataStructs.ConvertToNumpyArray(features_vec, fingerprints)
 
+            elif self.method == 'ecfp4':
+                if self._mfpgen is None:
+                    self._mfpgen = GetMorganGenerator(radius=2, fpSize=2048)
+                fingerprints = torch.from_numpy(
+                    self._mfpgen.GetFingerprintAsNumPy(mol).astype(np.float32))
+
             elif self.method == 'daylight':
                 bv = FingerprintMols.FingerprintMol(mol)
                 temp = tuple(bv.GetOnBits())
@@ -168,18 +377,13 @@ class FingerprintFromSmilePreprocessor(BasePreprocessor):
                 fingerprints = calcPubChemFingerAll(smiles)
 
             elif self.method == 'ammvf':
-                self.atom_dict = self.atom_dict if self.atom_dict is not None else defaultdict(
-                    lambda: len(self.atom_dict))
-                self.bond_dict = self.bond_dict if self.bond_dict is not None else defaultdict(
-                    lambda: len(self.bond_dict))
-                self.fingerprint_dict = self.fingerprint_dict if self.fingerprint_dict is not None else defaultdict(
-                    lambda: len(self.fingerprint_dict))
-                self.edge_dict = self.edge_dict if self.edge_dict is not None else defaultdict(
-                    lambda: len(self.edge_dict))
+                self._init_vocab()
+                if self._wl_kernel is None:
+                    self._wl_kernel = get_wl_kernel(self.radius)
                 atoms = create_atoms(mol, self.atom_dict)
                 ij_bond_dict = create_ij_bond_dict(mol, self.bond_dict)
-                fingerprints = extract_fingerprints(
-                    atoms, ij_bond_dict, self.radius, self.fingerprint_dict, self.edge_dict)
+                fingerprints = torch.from_numpy(extract_fingerprints(
+                    atoms, ij_bond_dict, self.radius, self.fingerprint_dict, self.edge_dict, self._wl_kernel))
 
             elif self.method == 'custom':
                 fingerprints = self.custom_fingerprint(mol)
@@ -188,4 +392,234 @@ class FingerprintFromSmilePreprocessor(BasePreprocessor):
             print(
                 f'Error processing SMILES {smiles} with method {self.method}: {e}')
 
-        return torch.tensor(fingerprints, dtype=torch.float) if fingerprints is not None else None
+        if fingerprints is not None and not isinstance(fingerprints, torch.Tensor):
+            fingerprints = torch.tensor(fingerprints, dtype=torch.float)
+        self._cache_put(canonical_key, fingerprints)
+        self._cache_put(key, fingerprints)
+
+        return fingerprints
+
+    def _preprocess_chunk(self, smiles_list: List[str]) -> List[Optional[torch.Tensor]]:
+        return [self.preprocess(smiles) for smiles in smiles_list]
+
+    def preprocess_batch(self, smiles_list: List[str], n_jobs: int = 4) -> List[Optional[torch.Tensor]]:
+        """
+        Generate molecular fingerprints for a list of SMILES strings in parallel.
+
+        The list is split into `n_jobs` contiguous chunks and each chunk is handed to a single Loky worker,
+        so that worker start-up and pickling costs are paid once per chunk instead of once per molecule.
+        The 'ammvf' method grows its dictionaries while processing, so it is always run in the current process.
+
+        Parameters:
+        - smiles_list (List[str]): SMILES strings of the molecules.
+        - n_jobs (int, default 4): The number of worker processes to use.
+
+        Returns:
+        - List[Optional[torch.Tensor]]: The fingerprints, in the same order as `smiles_list`.
+        """
+        if self.method == 'ammvf':
+            n_jobs = 1
+
+        n_jobs = max(1, min(n_jobs, len(smiles_list)))
+        if n_jobs == 1:
+            return self._preprocess_chunk(smiles_list)
+
+        chunk_size = math.ceil(len(smiles_list) / n_jobs)
+        chunks = [smiles_list[i:i + chunk_size]
+                  for i in range(0, len(smiles_list), chunk_size)]
+        parallel = Parallel(n_jobs=n_jobs, backend='loky',
+                            mmap_mode='r', return_as='generator')
+        results = parallel(delayed(self._preprocess_chunk)(chunk)
+                           for chunk in chunks)
+
+        fingerprints = []
+        for chunk_result in tqdm(results, total=len(chunks), desc="Processing"):
+            fingerprints.extend(chunk_result)
+
+        return fingerprints
+
+    def preprocess_batch_threads(self, smiles_list: List[str], n_threads: int = 4,
+                                 block_size: int = 1024) -> List[Optional[torch.Tensor]]:
+        """
+        Generate molecular fingerprints for a list of SMILES strings with a pool of threads.
+
+        RDKit releases the GIL in its C++ code, so threads run the parsing and fingerprinting in parallel
+        without the pickling cost of worker processes. The 'ammvf' method grows its dictionaries while
+        processing, and the ids depend on the order in which molecules are seen. For 'ammvf', only the parsing
+        runs in the threads, one block of molecules at a time. The fingerprints are then built serially in
+        input order, so the ids are the same as with `preprocess`.
+
+        Parameters:
+        - smiles_list (List[str]): SMILES strings of the molecules.
+        - n_threads (int, default 4): The number of threads to use.
+        - block_size (int, default 1024): Number of molecules parsed at a time for the 'ammvf' method.
+
+        Returns:
+        - List[Optional[torch.Tensor]]: The fingerprints, in the same order as `smiles_list`.
+        """
+        n_threads = max(1, min(n_threads, len(smiles_list)))
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            if self.method != 'ammvf':
+                return list(tqdm(executor.map(self.preprocess, smiles_list),
+                                 total=len(smiles_list), desc="Processing"))
+
+            return list(tqdm(self._iter_ammvf(smiles_list, executor, block_size),
+                             total=len(smiles_list), desc="Processing"))
+
+    def _iter_ammvf(self, smiles_list: List[str], executor: ThreadPoolExecutor,
+                    block_size: int) -> Iterator[Optional[torch.Tensor]]:
+        # Parse one block of molecules in the threads, then build their fingerprints serially in input order
+        for start in range(0, len(smiles_list), block_size):
+            block = smiles_list[start:start + block_size]
+            for smiles, mol in zip(block, executor.map(Chem.MolFromSmiles, block)):
+                key = self._cache_key(smiles)
+                fingerprints = self._cache_get(key)
+                yield fingerprints if fingerprints is not _MISSING else self._preprocess_mol(smiles, key, mol)
+
+    def _process_in_memory(self, data: List[str], num_threads: int) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Process the unique SMILES strings in batch instead of one Ray task per molecule. The 'rdkit' and
+        'ammvf' methods use threads (`preprocess_batch_threads`), the other methods worker processes
+        (`preprocess_batch`).
+        """
+        if self.method in ('rdkit', 'ammvf'):
+            fingerprints = self.preprocess_batch_threads(
+                list(data), num_threads)
+        else:
+            fingerprints = self.preprocess_batch(list(data), num_threads)
+        all_processed_data = dict(zip(data, fingerprints))
+        invalid_results = [
+            smiles for smiles, fingerprint in all_processed_data.items() if fingerprint is None]
+
+        return all_processed_data, invalid_results
+
+    def _process_to_store(self, data: List[str], store: ProcessedDataStore, num_threads: int,
+                          batch_size: int = 1024) -> List[str]:
+        """
+        Write the fingerprints of the SMILES strings to the on-disk store. The 'ammvf' dictionaries would be
+        grown separately in every Ray worker, giving different molecules the same ids, so 'ammvf' is processed
+        in this process, parsing one batch in threads as in `preprocess_batch_threads` and writing it before
+        the next one. The other methods use the Ray path.
+        """
+        if self.method != 'ammvf':
+            return super()._process_to_store(data, store, num_threads, batch_size)
+
+        data = list(data)
+        invalid_results = []
+        batch = []
+        with ThreadPoolExecutor(max_workers=max(1, min(num_threads, len(data)))) as executor:
+            fingerprints = self._iter_ammvf(data, executor, batch_size)
+            for smiles, fingerprint in zip(data, tqdm(fingerprints, total=len(data), desc="Processing")):
+                if fingerprint is None:
+                    invalid_results.append(smiles)
+                batch.append((smiles, None if fingerprint is None else self._value_to_blob(fingerprint)))
+                if len(batch) >= batch_size:
+                    store.put_blobs(batch)
+                    batch = []
+        store.put_blobs(batch)
+        # The fingerprints are read back from the store, so they are not kept in memory
+        with self._cache_lock:
+            self._cache.clear()
+
+        return invalid_results
+
+    def _value_to_blob(self, data: torch.Tensor) -> bytes:
+        # Raw fingerprint bytes instead of a pickled tensor, behind a header holding the dtype, the number of
+        # dimensions and the shape
+        array = data.numpy()
+        shape = np.array([array.ndim, *array.shape], dtype=np.int64)
+        return array.dtype.str.encode().ljust(_DTYPE_HEADER_SIZE) + shape.tobytes() + array.tobytes()
+
+    def _blob_to_value(self, blob: bytes) -> torch.Tensor:
+        dtype = np.dtype(blob[:_DTYPE_HEADER_SIZE].decode().strip())
+        ndim = int(np.frombuffer(blob, dtype=np.int64, count=1, offset=_DTYPE_HEADER_SIZE)[0])
+        shape = np.frombuffer(blob, dtype=np.int64, count=ndim, offset=_DTYPE_HEADER_SIZE + 8).tolist()
+        offset = _DTYPE_HEADER_SIZE + 8 * (ndim + 1)
+        return torch.from_numpy(np.frombuffer(bytearray(blob), dtype=dtype, offset=offset).reshape(shape))
+
+    def save_preprocessed_to_disk(self, data: Dict[str, Optional[torch.Tensor]], path: str, file_prefix: str) -> None:
+        """
+        Save all the fingerprints to a single `.npz` file as one contiguous `values` array plus `offsets`,
+        so that the fingerprint of the i-th SMILES is `values[offsets[i]:offsets[i + 1]]`, reshaped to its
+        `ndims[i]` dimensions in `shapes`, which are concatenated the same way. The SMILES are
+        stored the same way, as one UTF-8 byte buffer `key_bytes` plus `key_offsets`, instead of a
+        fixed-width string array padded to the longest SMILES.
+
+        Parameters:
+        - data (Dict[str, Optional[torch.Tensor]]): The fingerprints keyed by SMILES, None for invalid molecules.
+        - path (str): The directory where the data should be saved.
+        - file_prefix (str): Prefix to be added to the filename.
+        """
+        keys = list(data.keys())
+        fingerprints = [torch.as_tensor(fingerprint) if fingerprint is not None else None
+                        for fingerprint in data.values()]
+        valid = np.array([fingerprint is not None for fingerprint in fingerprints], dtype=bool)
+        ndims = np.array([fingerprint.dim() if fingerprint is not None else 0 for fingerprint in fingerprints],
+                         dtype=np.int64)
+        shapes = np.array([size for fingerprint in fingerprints if fingerprint is not None
+                           for size in fingerprint.shape], dtype=np.int64)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([fingerprint.numel() if fingerprint is not None else 0 for fingerprint in fingerprints],
+                  out=offsets[1:])
+        present = [fingerprint.reshape(-1) for fingerprint in fingerprints if fingerprint is not None]
+        values = torch.cat(present).numpy() if present else np.empty(0, dtype=np.int64)
+
+        encoded = [key.encode('utf-8') for key in keys]
+        key_bytes = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        key_offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(key) for key in encoded], out=key_offsets[1:])
+
+        np.savez(self.get_saved_path(path, file_prefix), key_bytes=key_bytes, key_offsets=key_offsets,
+                 values=values, offsets=offsets, valid=valid, ndims=ndims, shapes=shapes)
+
+    def load_preprocessed_to_memory(self, path: str) -> Dict[str, Optional[torch.Tensor]]:
+        """
+        Load the fingerprints saved by `save_preprocessed_to_disk`.
+
+        All fingerprints are views into one shared-memory tensor, so no tensor is allocated per molecule
+        and DataLoader workers reuse the same storage.
+
+        Parameters:
+        - path (str): Path to the `.npz` file.
+
+        Returns:
+        - Dict[str, Optional[torch.Tensor]]: The fingerprints keyed by SMILES, None for invalid molecules.
+        """
+        if not os.path.exists(path):  # Saved as a pickle by an earlier version
+            return super().load_preprocessed_to_memory(os.path.splitext(path)[0] + ".pkl")
+
+        with np.load(path) as saved:
+            key_bytes = saved['key_bytes'].tobytes()
+            key_offsets = saved['key_offsets'].tolist()
+            values = torch.from_numpy(saved['values'])
+            offsets = saved['offsets'].tolist()
+            valid = saved['valid'].tolist()
+            ndims = saved['ndims'].tolist()
+            shapes = saved['shapes'].tolist()
+
+        keys = [key_bytes[key_offsets[i]:key_offsets[i + 1]].decode('utf-8')
+                for i in range(len(key_offsets) - 1)]
+        values.share_memory_()
+        fingerprints = {}
+        start = 0
+        for i, key in enumerate(keys):
+            if not valid[i]:
+                fingerprints[key] = None
+                continue
+            fingerprints[key] = values[offsets[i]:offsets[i + 1]].view(shapes[start:start + ndims[i]])
+            start += ndims[i]
+
+        return fingerprints
+
+    def get_saved_path(self, path: str, prefix: str) -> str:
+        """
+        Construct the path of the saved fingerprint file.
+
+        Parameters:
+        - path: Base directory of the saved file.
+        - prefix: Prefix added to the filename.
+
+        Returns:
+        - str: Full path to the saved file.
+        """
+        return os.path.join(path, f"{prefix}_all.npz")
@@ -3,8 +3,10 @@ this helper script is from PyBioMed to get protein descriptors.
 Taken from https://pybiomed.readthedocs.io/en/latest/
 """
 
+from functools import partial
 from collections import defaultdict
 import numpy as np
+from numba import njit
 from rdkit import DataStructs
 from rdkit import Chem
 import math
@@ -3592,50 +3594,240 @@ def calcPubChemFingerAll(s):
 # ------------------------------------
 
 
+def _intern(d, k):
+    # Id of `k` in the vocabulary `d`, assigning the next free id on a miss.
+    v = d.get(k)
+    return v if v is not None else d.setdefault(k, len(d))
+
+
 def create_atoms(mol, atom_dict):
-    atoms = [a.GetSymbol() for a in mol.GetAtoms()]
-    for a in mol.GetAromaticAtoms():
-        i = a.GetIdx()
-        atoms[i] = (atoms[i], 'aromatic')
-    atoms = [atom_dict[a] for a in atoms]
-    return np.array(atoms)
+    # Aromatic atoms are keyed as '<symbol>|arom', e.g. 'c' in benzene becomes 'C|arom'.
+    symbols = np.array([a.GetSymbol() for a in mol.GetAtoms()], dtype=object)
+    aromatic = np.zeros(len(symbols), dtype=bool)
+    aromatic[np.fromiter((a.GetIdx() for a in mol.GetAromaticAtoms()), dtype=np.intp)] = True
+    keys = np.where(aromatic, symbols + '|arom', symbols)
+    return np.fromiter((_intern(atom_dict, k) for k in keys), dtype=np.int32, count=len(keys))
 
 
 def create_ij_bond_dict(mol, bond_dict):
     ij_bond_dict = defaultdict(list)
     for b in mol.GetBonds():
         i, j = b.GetBeginAtomIdx(), b.GetEndAtomIdx()
-        bond = bond_dict[str(b.GetBondType())]
+        bond = _intern(bond_dict, str(b.GetBondType()))
         ij_bond_dict[i].append((j, bond))
         ij_bond_dict[j].append((i, bond))
     return ij_bond_dict
 
 
-def extract_fingerprints(atoms, ij_bond_dict, radius, fingerprint_dict, edge_dict):
+def ij_bond_dict_to_csr(ij_bond_dict, n_atoms):
+    # Flatten the neighbor lists into CSR arrays: the neighbors of atom i are
+    # neighbors[indptr[i]:indptr[i + 1]], joined by the bonds edges[indptr[i]:indptr[i + 1]].
+    degrees = np.zeros(n_atoms, dtype=np.int32)
+    for i, j_edge in ij_bond_dict.items():
+        degrees[i] = len(j_edge)
+    indptr = np.zeros(n_atoms + 1, dtype=np.int32)
+    np.cumsum(degrees, out=indptr[1:])
+    neighbors = np.empty(indptr[-1], dtype=np.int32)
+    edges = np.empty(indptr[-1], dtype=np.int32)
+    for i, j_edge in ij_bond_dict.items():
+        start = indptr[i]
+        for offset, (j, edge) in enumerate(j_edge):
+            neighbors[start + offset] = j
+            edges[start + offset] = edge
+    return indptr, neighbors, edges
+
+
+_FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+_FNV_PRIME = np.uint64(0x100000001b3)
+
+
+@njit(cache=True)
+def _fnv1a(h, word):
+    # FNV-1a over the eight bytes of a 64-bit word.
+    for _ in range(8):
+        h = (h ^ (word & np.uint64(0xFF))) * _FNV_PRIME
+        word = word >> np.uint64(8)
+    return h
+
+
+@njit(cache=True)
+def _reverse_edges(indptr, neighbors):
+    # rev[k] is the position of the opposite direction (j -> i) of the CSR entry k (i -> j).
+    rev = np.empty(neighbors.shape[0], dtype=np.int32)
+    for i in range(indptr.shape[0] - 1):
+        for k in range(indptr[i], indptr[i + 1]):
+            j = neighbors[k]
+            for t in range(indptr[j], indptr[j + 1]):
+                if neighbors[t] == i:
+                    rev[k] = t
+                    break
+    return rev
+
+
+_NETWORK_SIZE = 6
+_KEY_PAD = np.uint64(0xffffffffffffffff)
+
+
+@njit(cache=True, inline='always')
+def _compare_swap(keys, a, b):
+    low, high = min(keys[a], keys[b]), max(keys[a], keys[b])
+    keys[a] = low
+    keys[b] = high
+
+
+@njit(cache=True)
+def _sort6(keys):
+    # Optimal 12-comparator sorting network for six keys. Shorter neighborhoods are
+    # padded with the largest uint64, which the network moves past the real keys.
+    _compare_swap(keys, 0, 5)
+    _compare_swap(keys, 1, 3)
+    _compare_swap(keys, 2, 4)
+    _compare_swap(keys, 1, 2)
+    _compare_swap(keys, 3, 4)
+    _compare_swap(keys, 0, 3)
+    _compare_swap(keys, 2, 5)
+    _compare_swap(keys, 0, 1)
+    _compare_swap(keys, 2, 3)
+    _compare_swap(keys, 4, 5)
+    _compare_swap(keys, 1, 2)
+    _compare_swap(keys, 3, 4)
+
+
+@njit(cache=True, inline='always')
+def _wl_step(nodes, edge_labels, indptr, neighbors, rev, small_keys, new_nodes, new_edge_labels):
+    # One Weisfeiler-Lehman step: relabels the nodes and edges from `nodes` and `edge_labels`
+    # into `new_nodes` and `new_edge_labels`.
+    # Node and edge labels are updated in a single pass over the CSR arrays. The label
+    # of an edge needs the new labels of both ends, so it is written (for both
+    # directions) once the second of its two atoms has been relabeled.
+    for i in range(nodes.shape[0]):
+        start, end = indptr[i], indptr[i + 1]
+        degree = end - start
+        # Each (neighbor, edge) pair is packed into one 64-bit key, so the neighborhood
+        # becomes a single contiguous array that is sorted and hashed word by word.
+        # Organic atoms rarely have more than six neighbors, so those neighborhoods
+        # are sorted in a reused buffer by a fixed network instead of np.sort.
+        if degree <= _NETWORK_SIZE:
+            keys = small_keys
+            keys[:] = _KEY_PAD
+        else:
+            keys = np.empty(degree, dtype=np.uint64)
+        for t in range(degree):
+            keys[t] = _fnv1a(_fnv1a(_FNV_OFFSET, nodes[neighbors[start + t]]),
+                             edge_labels[start + t])
+        if degree <= _NETWORK_SIZE:
+            _sort6(keys)
+        else:
+            keys.sort()
+
+        h = _fnv1a(_FNV_OFFSET, nodes[i])
+        h = _fnv1a(h, np.uint64(degree))
+        for t in range(degree):
+            h = _fnv1a(h, keys[t])
+        new_nodes[i] = h
+
+        for k in range(start, end):
+            j = neighbors[k]
+            if j < i:
+                low, high = new_nodes[i], new_nodes[j]
+                if low > high:
+                    low, high = high, low
+                h = _fnv1a(_FNV_OFFSET, low)
+                h = _fnv1a(h, high)
+                h = _fnv1a(h, edge_labels[k])
+                new_edge_labels[k] = h
+                new_edge_labels[rev[k]] = h
+
+
+# Weisfeiler-Lehman refinement on 64-bit labels. A node label is the hash of
+# (node, sorted packed (neighbor, edge) keys) and an edge label the hash of
+# (sorted (node_i, node_j), edge), so equal substructures map to equal labels
+# across molecules without consulting the fingerprint/edge dictionaries.
+# `_wl_r1` and `_wl_r2` unroll the radius loop for the common radii; select a
+# kernel with `get_wl_kernel`.
+
+@njit(cache=True)
+def _wl_r1(atoms, indptr, neighbors, edges):
+    rev = _reverse_edges(indptr, neighbors)
+    small_keys = np.empty(_NETWORK_SIZE, dtype=np.uint64)
+    nodes = atoms.astype(np.uint64)
+    edge_labels = edges.astype(np.uint64)
+    new_nodes = np.empty(nodes.shape[0], dtype=np.uint64)
+    new_edge_labels = np.empty(edge_labels.shape[0], dtype=np.uint64)
+
+    _wl_step(nodes, edge_labels, indptr, neighbors, rev,
+             small_keys, new_nodes, new_edge_labels)
+    return new_nodes, new_edge_labels
+
+
+@njit(cache=True)
+def _wl_r2(atoms, indptr, neighbors, edges):
+    rev = _reverse_edges(indptr, neighbors)
+    small_keys = np.empty(_NETWORK_SIZE, dtype=np.uint64)
+    nodes = atoms.astype(np.uint64)
+    edge_labels = edges.astype(np.uint64)
+    new_nodes = np.empty(nodes.shape[0], dtype=np.uint64)
+    new_edge_labels = np.empty(edge_labels.shape[0], dtype=np.uint64)
+
+    _wl_step(nodes, edge_labels, indptr, neighbors, rev,
+             small_keys, new_nodes, new_edge_labels)
+    _wl_step(new_nodes, new_edge_labels, indptr, neighbors, rev,
+             small_keys, nodes, edge_labels)
+    return nodes, edge_labels
+
+
+@njit(cache=True)
+def _wl_general(atoms, indptr, neighbors, edges, radius):
+    rev = _reverse_edges(indptr, neighbors)
+    small_keys = np.empty(_NETWORK_SIZE, dtype=np.uint64)
+    nodes = atoms.astype(np.uint64)
+    edge_labels = edges.astype(np.uint64)
+    new_nodes = np.empty(nodes.shape[0], dtype=np.uint64)
+    new_edge_labels = np.empty(edge_labels.shape[0], dtype=np.uint64)
+
+    for _ in range(radius):
+        _wl_step(nodes, edge_labels, indptr, neighbors, rev,
+                 small_keys, new_nodes, new_edge_labels)
+        nodes, new_nodes = new_nodes, nodes
+        edge_labels, new_edge_labels = new_edge_labels, edge_labels
+
+    return nodes, edge_labels
+
+
+def get_wl_kernel(radius):
+    """
+    Get the Weisfeiler-Lehman kernel for `radius`, unrolled for radius 1 and 2.
+    The kernel is called as `kernel(atoms, indptr, neighbors, edges)`.
+    Radius 0 needs no kernel, as extract_fingerprints uses the atom ids directly.
+    """
+    if radius == 1:
+        return _wl_r1
+    if radius == 2:
+        return _wl_r2
+    return partial(_wl_general, radius=radius)
+
+
+def extract_fingerprints(atoms, ij_bond_dict, radius, fingerprint_dict, edge_dict, wl_kernel=None):
+    # `edge_dict` is only kept for API compatibility: the edge labels are used inside the
+    # WL kernel and never looked up afterwards, so the dictionary is no longer filled.
     if (len(atoms) == 1) or (radius == 0):
-        fingerprints = [fingerprint_dict[a] for a in atoms]
+        fingerprints = [_intern(fingerprint_dict, a) for a in atoms.tolist()]
 
     else:
-        nodes = atoms
-        ij_edge_dict = ij_bond_dict
-
-        for _ in range(radius):
-            fingerprints = []
-            for i, j_edge in ij_edge_dict.items():
-                neighbors = [(nodes[j], edge) for j, edge in j_edge]
-                fingerprint = (nodes[i], tuple(sorted(neighbors)))
-                fingerprints.append(fingerprint_dict[fingerprint])
-            nodes = fingerprints
-
-            _ij_edge_dict = defaultdict(lambda: [])
-            for i, j_edge in ij_edge_dict.items():
-                for j, edge in j_edge:
-                    both_side = tuple(sorted((nodes[i], nodes[j])))
-                    edge = edge_dict[(both_side, edge)]
-                    _ij_edge_dict[i].append((j, edge))
-            ij_edge_dict = _ij_edge_dict
+        if len(ij_bond_dict) != len(atoms):
+            raise ValueError(
+                'The number of atoms and fingerprints are different.')
+
+        indptr, neighbors, edges = ij_bond_dict_to_csr(
+            ij_bond_dict, len(atoms))
+        if wl_kernel is None:
+            wl_kernel = get_wl_kernel(radius)
+        nodes, _ = wl_kernel(
+            np.asarray(atoms), indptr, neighbors, edges)
+        fingerprints = [_intern(fingerprint_dict, node)
+                        for node in nodes.tolist()]
 
     if len(fingerprints) != len(atoms):
         raise ValueError('The number of atoms and fingerprints are different.')
 
-    return np.array(fingerprints)
+    return np.array(fingerprints, dtype=np.int64)
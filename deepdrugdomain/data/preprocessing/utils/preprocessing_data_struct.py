@@ -1,5 +1,6 @@
-import json
 import os
+import numpy as np
+import orjson
 from typing import Dict, Any, List, Tuple
 from .. import PreprocessorFactory, BasePreprocessor
 from typing import overload, TypeVar, Dict, Union
@@ -45,11 +46,15 @@ class PreprocessingObjectBase(ABC):
             Get the unique data from the attribute(s).
         _preprocessing_done(self, directory)
             Check if preprocessing has been done for the entire dataset.
+        _invalid_mask(self, data, data_unique)
+            Get a boolean mask of the rows whose processed data is None.
         _clean_data(self, data, data_unique)
             Clean the data by removing rows where processed data is None for
             any of the preprocessed attributes.
         _load_mapping(self, directory)
-            Load the mapping dictionary from the shard directory.
+            Load the mapping dictionary (or the on-disk store) from the shard directory.
+        _prepare(self, data, directory, threads)
+            Preprocess the unique data and return the mapping, without cleaning the data.
         __call__(self, data, directory, threads)
             Perform preprocessing on the data.
         __repr__(self)
@@ -89,72 +94,101 @@ class PreprocessingObjectBase(ABC):
 
     def _preprocessing_done(self, directory) -> bool:
         """
-        Check if preprocessing has been done for the entire dataset.
+        Check if preprocessing has been done for the entire dataset. The vocabulary saved with the
+        preprocessed files, if any, is loaded into the preprocessor; files produced with a different
+        vocabulary are treated as not preprocessed.
 
         Returns:
         - bool: True if preprocessing files are found, False otherwise.
         """
-        mapping_path = os.path.join(
-            directory, f"{self.preprocessing_type}_{self.attribute}_mapping_info.json")
+        prefix = f"{self.preprocessing_type}_{self.attribute}"
+        if self.in_memory:
+            saved_paths = [os.path.join(
+                directory, f"{prefix}_mapping_info.json")]
+        else:
+            saved_paths = [self.preprocess.get_store_path(directory, prefix),
+                           self.preprocess.get_invalid_keys_path(directory, prefix)]
+
+        return all(os.path.exists(path) for path in saved_paths) and self.preprocess.load_vocab(
+            directory, prefix)
 
-        return os.path.exists(mapping_path)
+    def _invalid_mask(self, data, data_unique) -> np.ndarray:
+        """
+        Get a boolean mask of the rows where processed data is None for the
+        preprocessed attribute.
+        """
+        none_col_list = self.preprocess.collect_invalid_data(
+            self.online, data_unique)
+        return data[self.attribute].isin(none_col_list).to_numpy()
 
     def _clean_data(self, data, data_unique) -> None:
         """
         Clean the data by removing rows where processed data is None for
         any of the preprocessed attributes.
         """
-        none_col_list = self.preprocess.collect_invalid_data(
-            self.online, data_unique)
-        data_new = data.dropna()
-        return data_new[~data_new[self.attribute].isin(none_col_list)]
+        keep_mask = data.notna().all(axis=1).to_numpy(copy=True)
+        keep_mask &= ~self._invalid_mask(data, data_unique)
+        return data.loc[keep_mask]
 
     def _load_mapping(self, directory) -> Dict[Any, Any]:
         """
-        Load the mapping dictionary from the shard directory.
+        Load the mapping dictionary from the shard directory. For data that is not kept in memory,
+        only the list of invalid keys is read and the on-disk store is opened, so nothing proportional
+        to the dataset size is loaded.
 
         Returns:
-        - Dict: mapping dictionary of the relevant data
+        - Dict: mapping dictionary of the relevant data (a ProcessedDataStore when not in memory)
         """
+        prefix = f"{self.preprocessing_type}_{self.attribute}"
+        if not self.in_memory:
+            self.preprocess.set_invalid_data(
+                self.preprocess.load_invalid_keys(directory, prefix))
+            return self.preprocess.open_store(directory, prefix)
+
         mapping_path = os.path.join(directory,
                                     f"{self.preprocessing_type}_{self.attribute}_mapping_info.json")
 
-        # Use Python's json module to load the mapping
-        with open(mapping_path, 'r') as file:
-            mapping = json.load(file)
+        # orjson parses the (potentially large) mapping file much faster than Python's json module
+        with open(mapping_path, 'rb') as file:
+            mapping = orjson.loads(file.read())
 
-        nones = []
-        for item in mapping.keys():
-            if mapping[item] is None:
-                nones.append(item)
+        nones = [item for item, value in mapping.items() if value is None]
 
         self.preprocess.set_invalid_data(nones)
 
         return mapping
 
-    def __call__(self, data, directory, threads) -> List[Tuple[Any, Dict[Any, Any]]]:
+    def _prepare(self, data, directory, threads) -> Tuple[Tuple[Any, Dict[Any, Any]], List[Any]]:
+        """
+        Preprocess the unique values of the attribute and build its mapping.
+
+        Returns:
+        - Tuple: the mapping of the attribute and the unique data it was built from.
+        """
         data_unique = self._get_unique_data(data)
         if self.online:
             if self.preprocess is not None:
                 data_unique = self.preprocess.data_preparations(
                     data_unique)
             mapping = (self.attribute, None)
-            data = self._clean_data(data, data_unique)
             print(f"Preprocessing {self.attribute} done.")
-            return data, mapping
+            return mapping, data_unique
 
         if self._preprocessing_done(directory):
 
             mapping_data = self._load_mapping(directory)
             if self.in_memory:
-                data_path = os.path.join(
-                    directory, f"{self.preprocessing_type}_{self.attribute}_all.pkl")
+                data_path = self.preprocess.get_saved_path(
+                    directory, f"{self.preprocessing_type}_{self.attribute}")
                 processed_data = self.preprocess.load_preprocessed_to_memory(
                     data_path)
             else:
                 processed_data = None
 
-            new_data = list(set(data_unique) - set(mapping_data.keys()))
+            if self.in_memory:
+                new_data = list(set(data_unique) - set(mapping_data.keys()))
+            else:
+                new_data = mapping_data.missing(data_unique)
 
             if len(new_data) > 0:
                 _ = self.preprocess.update(
@@ -171,9 +205,15 @@ class PreprocessingObjectBase(ABC):
                 data_unique, directory, self.in_memory, threads, f"{self.preprocessing_type}_{self.attribute}")
             mapping_data = info_dict['mapping_info'] if not self.in_memory else info_dict['processed_data']
 
+        self.preprocess.save_vocab(
+            directory, f"{self.preprocessing_type}_{self.attribute}")
         mapping = (self.attribute, mapping_data)
-        data = self._clean_data(data, data_unique)
         print(f"Preprocessing {self.attribute} from {self.from_dtype} to {self.to_dtype} is done.")
+        return mapping, data_unique
+
+    def __call__(self, data, directory, threads) -> List[Tuple[Any, Dict[Any, Any]]]:
+        mapping, data_unique = self._prepare(data, directory, threads)
+        data = self._clean_data(data, data_unique)
         return data, mapping
 
     def __repr__(self):
@@ -219,10 +259,19 @@ class PreprocessingList:
                         self.preprocessing_type[idx2] = new_name
 
     def __call__(self, data: Any, directory: str, threads: int) -> Any:
+        # Rows are dropped through a single boolean mask, so the DataFrame is
+        # only copied once instead of once per preprocessed attribute.
         mappings = []
+        keep_mask = data.notna().all(axis=1).to_numpy(copy=True)
         for i in self.p_list:
-            data, mapping = i(data, directory, threads)
+            columns = i.attribute if isinstance(
+                i.attribute, list) else [i.attribute]
+            mapping, data_unique = i._prepare(
+                data.loc[keep_mask, columns], directory, threads)
+            keep_mask &= ~i._invalid_mask(data, data_unique)
             mappings.append(mapping)
+
+        data = data.loc[keep_mask].reset_index(drop=True)
         return data, mappings
 
     def __add__(self, other):
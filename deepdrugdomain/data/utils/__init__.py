@@ -1,5 +1,5 @@
 from .dgl_hdf5_utils import serialize_dgl_graph_hdf5, deserialize_dgl_graph_hdf5
-from .dataset_utils import estimate_sample_size, assert_unique_combinations, ensure_list, get_processed_data
+from .dataset_utils import estimate_sample_size, assert_unique_combinations, ensure_list, get_processed_data, get_processed_data_batch
 from .base_dataset import CustomDataset
 from ..datasets.factory import DatasetFactory
 from .default_dataset import DDDDataset
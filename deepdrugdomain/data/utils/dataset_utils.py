@@ -1,4 +1,3 @@
-import os
 import sys
 from typing import Any, List, Union, Dict, Tuple
 
@@ -110,11 +109,33 @@ def get_processed_data(online: bool, mapping: Tuple[str, Any], pre_process, in_m
     if online:
         return pre_process.preprocess(row_data)
 
+    # In memory, the mapping holds the processed data itself; otherwise it is the on-disk
+    # store, which reads the single requested record.
+    return mapping[1][row_data]
+
+
+def get_processed_data_batch(online: bool, mapping: Tuple[str, Any], pre_process, in_mem, keys) -> List[Any]:
+    """
+    Batched version of `get_processed_data`: fetch the processed data of several rows of one attribute.
+
+    Parameters:
+    - online (bool): Whether the attribute is preprocessed on the fly.
+    - mapping (Tuple[str, Any]): The attribute name and its mapping to the processed data (or its on-disk store).
+    - pre_process: The preprocessor of the attribute, None if the raw data is used as-is.
+    - in_mem (bool): Whether the processed data is kept in memory.
+    - keys: The raw values of the attribute for the requested rows.
+
+    Returns:
+    - List[Any]: The processed data, in the same order as `keys`.
+    """
+
+    if pre_process is None:
+        return list(keys)
+
+    if online:
+        return [pre_process.preprocess(key) for key in keys]
+
     elif in_mem:
-        return mapping[1][row_data]
+        return list(map(mapping[1].__getitem__, keys))
     else:
-        path = mapping[1][row_data]
-        if os.path.exists(path):  # Check if shard exists before loading
-            return pre_process.load_data(path)
-        else:
-            raise FileNotFoundError(f"Shard file {path} not found.")
+        return mapping[1].get_many(keys)
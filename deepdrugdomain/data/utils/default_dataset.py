@@ -2,12 +2,13 @@
 import json
 import os
 import pandas as pd
+from pandas.api.types import is_object_dtype, is_string_dtype
 import torch
 from torch.utils.data import Dataset
 
 from ..preprocessing.utils import PreprocessingList
 from typing import List, Any, Optional, Dict, Tuple
-from .dataset_utils import get_processed_data
+from .dataset_utils import get_processed_data, get_processed_data_batch
 
 
 class DDDDataset(Dataset):
@@ -48,6 +49,8 @@ class DDDDataset(Dataset):
         Returns the length of the dataset.
     __getitem__(index: int) -> Any:
         Retrieves the preprocessed data at the specified index.
+    __getitems__(indices: List[int]) -> List[Any]:
+        Retrieves the preprocessed data of a batch of indices at once. Used by the PyTorch DataLoader.
     
     Example:
     -------
@@ -70,17 +73,68 @@ class DDDDataset(Dataset):
         self.data, self.mapping = preprocesses(data, save_directory, threads)
         self.preprocesses = preprocesses
 
+        # Each attribute is stored as integer codes into its unique values, so the raw value of a
+        # row is `self._cats[col][self._codes[col][index]]` and the pandas indexers are never used.
+        # String columns become categorical, which also shares the memory of repeated values
+        # (e.g. the SMILES of a drug tested against many proteins).
+        columns = {m[0] for m in self.mapping if m[0] is not None}
+        self.data = self.data.astype({col: 'category' for col in columns
+                                      if is_object_dtype(self.data[col]) or is_string_dtype(self.data[col])})
+        self._codes = {}
+        self._cats = {}
+        for col in columns:
+            if isinstance(self.data[col].dtype, pd.CategoricalDtype):
+                # Rows with invalid values have been dropped, and so are their categories
+                self.data[col] = self.data[col].cat.remove_unused_categories()
+                self._codes[col] = self.data[col].cat.codes.to_numpy()
+                self._cats[col] = self.data[col].cat.categories.to_numpy()
+            else:
+                self._codes[col], self._cats[col] = pd.factorize(self.data[col])
+
+        # For attributes kept in memory, the processed data of each unique value is looked up
+        # once, so items are fetched by integer indexing instead of hashing the raw value
+        # (e.g. a SMILES string) on every access.
+        self._unique_values = {}
+        for idx, ((_, pre_process, online, in_mem), mapping) in enumerate(zip(self.preprocesses, self.mapping)):
+            if mapping[0] is None or pre_process is None or online or not in_mem:
+                continue
+            self._unique_values[idx] = [mapping[1][value]
+                                        for value in self._cats[mapping[0]]]
+
     def __len__(self) -> int:
         return len(self.data.index)
 
     def __getitem__(self, index: int) -> Any:
         attrs = zip(self.preprocesses, self.mapping)
         data = []
-        for (_, pre_process, online, in_mem), mapping in attrs:
+        for idx, ((_, pre_process, online, in_mem), mapping) in enumerate(attrs):
             if mapping[0] is None:
                 continue
+            code = self._codes[mapping[0]][index]
+            if idx in self._unique_values:
+                data.append(self._unique_values[idx][code])
             else:
                 data.append(get_processed_data(online, mapping, pre_process,
-                                               in_mem, self.data.iloc[index][mapping[0]]))
+                                               in_mem, self._cats[mapping[0]][code]))
 
         return data
+
+    def __getitems__(self, indices: List[int]) -> List[Any]:
+        columns = []
+        attrs = zip(self.preprocesses, self.mapping)
+        for idx, ((_, pre_process, online, in_mem), mapping) in enumerate(attrs):
+            if mapping[0] is None:
+                continue
+            codes = self._codes[mapping[0]][indices]
+            if idx in self._unique_values:
+                values = self._unique_values[idx]
+                columns.append([values[code] for code in codes])
+            else:
+                keys = self._cats[mapping[0]][codes]
+                columns.append(get_processed_data_batch(online, mapping, pre_process,
+                                                        in_mem, keys))
+
+        if not columns:
+            return [[] for _ in indices]
+
+        return [list(sample) for sample in zip(*columns)]
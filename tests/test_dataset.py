@@ -0,0 +1,59 @@
+import tempfile
+import unittest
+
+import pandas as pd
+import torch
+from deepdrugdomain.data import BasePreprocessor, DDDDataset, PreprocessingList, PreprocessingObject, \
+    PreprocessorFactory
+
+
+@PreprocessorFactory.register('test_label', 'label', 'label_tensor')
+class LabelPreprocessor(BasePreprocessor):
+    def preprocess(self, data):
+        return None if data == 'x' else torch.tensor(int(data))
+
+
+def equal(a, b):
+    if isinstance(a, torch.Tensor):
+        return isinstance(b, torch.Tensor) and torch.equal(a, b)
+    return a == b
+
+
+class TestDDDDataset(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Building the dataset starts Ray for the on-disk attribute, so it is done once
+        cls.directory = tempfile.TemporaryDirectory()
+        smiles = ['CCO', 'CCN', 'c1ccccc1', 'CCO', 'not a smiles', 'CCN', 'CC(=O)O']
+        df = pd.DataFrame({'SMILES': smiles,
+                           'Drug': smiles,
+                           'Label': ['1', '0', '1', '1', '0', 'x', '0']})
+        preprocesses = PreprocessingList([
+            PreprocessingObject('SMILES', 'smile', 'fingerprint', {'method': 'rdkit'},
+                                in_memory=True, online=False),
+            PreprocessingObject('Drug', 'smile', 'fingerprint', {'method': 'rdkit', 'pack_bits': True},
+                                in_memory=False, online=False),
+            PreprocessingObject('Label', 'label', 'label_tensor', {}, online=True)])
+        cls.dataset = DDDDataset(df, preprocesses, cls.directory.name, 1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_invalid_rows_are_dropped(self):
+        self.assertEqual(len(self.dataset), 5)
+
+    def test_getitems_matches_getitem(self):
+        indices = [4, 0, 2, 0, 3, 1]
+        batch = self.dataset.__getitems__(indices)
+        self.assertEqual(len(batch), len(indices))
+        for index, sample in zip(indices, batch):
+            expected = self.dataset[index]
+            self.assertEqual(len(sample), len(expected))
+            for value, expected_value in zip(sample, expected):
+                self.assertTrue(equal(value, expected_value))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import pickle
+import tempfile
+import unittest
+
+from deepdrugdomain.data.preprocessing import BasePreprocessor, ProcessedDataStore
+from deepdrugdomain.data.preprocessing.base_preprocessor import save_invalid_keys
+
+
+class PicklingPreprocessor(BasePreprocessor):
+    def preprocess(self, data):
+        return None if data == 'invalid' else [data, len(data)]
+
+
+class FilePreprocessor(PicklingPreprocessor):
+    # Stands in for the DGL preprocessors, which store their data in their own file format
+    def save_data(self, data, path):
+        with open(path, 'w') as fp:
+            fp.write(f"{data[0]},{data[1]}")
+
+    def load_data(self, path):
+        with open(path) as fp:
+            value, length = fp.read().split(',')
+        return ('loaded', value, int(length))
+
+
+class TestProcessedDataStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.preprocessor = PicklingPreprocessor()
+        self.store = self.preprocessor.open_store(self.directory.name, 'test')
+        self.store.put_blobs([(key, None if value is None else self.preprocessor._value_to_blob(value))
+                              for key, value in [('a', ['a', 1]), ('bb', ['bb', 2]), ('invalid', None)]])
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_get_item(self):
+        self.assertEqual(self.store['a'], ['a', 1])
+        self.assertIsNone(self.store['invalid'])
+        with self.assertRaises(KeyError):
+            self.store['missing']
+
+    def test_get_many_keeps_order_and_duplicates(self):
+        self.assertEqual(self.store.get_many(['bb', 'invalid', 'a', 'bb']),
+                         [['bb', 2], None, ['a', 1], ['bb', 2]])
+        with self.assertRaises(KeyError):
+            self.store.get_many(['a', 'missing'])
+
+    def test_get_many_matches_get_item(self):
+        # More keys than fit in a single query
+        keys = [f"key_{i}" for i in range(2000)]
+        self.store.put_blobs([(key, self.preprocessor._value_to_blob([key, i]))
+                              for i, key in enumerate(keys)])
+        self.assertEqual(self.store.get_many(keys), [self.store[key] for key in keys])
+
+    def test_missing(self):
+        self.assertEqual(self.store.missing(['a', 'new', 'invalid', 'other']), ['new', 'other'])
+        self.assertIn('invalid', self.store)
+        self.assertNotIn('new', self.store)
+        self.assertEqual(len(self.store), 3)
+
+    def test_clear(self):
+        self.store.clear()
+        self.assertEqual(len(self.store), 0)
+
+    def test_pickled_store_reconnects(self):
+        store = pickle.loads(pickle.dumps(self.store))
+        self.assertIsInstance(store, ProcessedDataStore)
+        self.assertIsNone(store._conn)
+        self.assertEqual(store.get_many(['a', 'invalid']), [['a', 1], None])
+        store.close()
+
+    def test_invalid_keys_sidecar(self):
+        save_invalid_keys(['invalid'], self.preprocessor.get_invalid_keys_path(self.directory.name, 'test'))
+        self.assertEqual(self.preprocessor.load_invalid_keys(self.directory.name, 'test'), ['invalid'])
+
+
+class TestBlobCodec(unittest.TestCase):
+
+    def test_pickle_round_trip(self):
+        preprocessor = PicklingPreprocessor()
+        blob = preprocessor._value_to_blob(['a', 1])
+        self.assertEqual(preprocessor._blob_to_value(blob), ['a', 1])
+
+    def test_uses_save_data_and_load_data_overrides(self):
+        preprocessor = FilePreprocessor()
+        blob = preprocessor._value_to_blob(['a', 1])
+        self.assertEqual(blob, b'a,1')
+        self.assertEqual(preprocessor._blob_to_value(blob), ('loaded', 'a', 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
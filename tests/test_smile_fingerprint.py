@@ -0,0 +1,215 @@
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+from deepdrugdomain.data.preprocessing import FingerprintFromSmilePreprocessor
+from deepdrugdomain.data.preprocessing.drug.smile_fingerprint import unpack_fingerprint_bits
+
+
+SMILES = ['CCO', 'CCN', 'CCCl', 'c1ccccc1O', 'CC(=O)Nc1ccc(O)cc1']
+
+
+class TestAmmvfOnDisk(unittest.TestCase):
+
+    def test_ids_match_serial_processing(self):
+        # Ids are only comparable across molecules if all of them are built from one vocabulary
+        serial = FingerprintFromSmilePreprocessor(method='ammvf')
+        expected = {smiles: serial.preprocess(smiles) for smiles in SMILES}
+
+        with tempfile.TemporaryDirectory() as directory:
+            preprocessor = FingerprintFromSmilePreprocessor(method='ammvf')
+            info = preprocessor.process_and_get_info(
+                SMILES, directory, in_memory=False, num_threads=2, file_prefix='test')
+            store = info['mapping_info']
+            for smiles in SMILES:
+                self.assertTrue(torch.equal(store[smiles], expected[smiles]))
+            store.close()
+
+        self.assertEqual(len(preprocessor._cache), 0)
+        self.assertFalse(torch.equal(expected['CCO'], expected['CCN']))
+        self.assertEqual(preprocessor.fingerprint_dict, serial.fingerprint_dict)
+
+
+    def test_store_is_written_in_batches(self):
+        class RecordingStore:
+            def __init__(self):
+                self.batches = []
+
+            def put_blobs(self, items):
+                self.batches.append(list(items))
+
+        serial = FingerprintFromSmilePreprocessor(method='ammvf')
+        expected = [serial.preprocess(smiles) for smiles in SMILES + ['not a smiles']]
+
+        preprocessor = FingerprintFromSmilePreprocessor(method='ammvf')
+        store = RecordingStore()
+        invalid = preprocessor._process_to_store(SMILES + ['not a smiles'], store, 2, batch_size=2)
+        self.assertEqual(invalid, ['not a smiles'])
+        self.assertTrue(all(len(batch) <= 2 for batch in store.batches))
+
+        items = [item for batch in store.batches for item in batch]
+        self.assertEqual([smiles for smiles, _ in items], SMILES + ['not a smiles'])
+        self.assertIsNone(items[-1][1])
+        for (_, blob), fingerprint in zip(items[:-1], expected):
+            self.assertTrue(torch.equal(preprocessor._blob_to_value(blob), fingerprint))
+
+
+class TestAmmvfVocab(unittest.TestCase):
+
+    def test_save_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            saved = FingerprintFromSmilePreprocessor(method='ammvf')
+            for smiles in SMILES[:3]:
+                saved.preprocess(smiles)
+            saved.save_vocab(directory, 'test')
+
+            loaded = FingerprintFromSmilePreprocessor(method='ammvf')
+            self.assertTrue(loaded.load_vocab(directory, 'test'))
+            self.assertEqual(loaded.atom_dict, saved.atom_dict)
+            self.assertEqual(loaded.bond_dict, saved.bond_dict)
+            self.assertEqual(loaded.fingerprint_dict, saved.fingerprint_dict)
+            self.assertEqual(loaded.edge_dict, saved.edge_dict)
+
+            # New molecules get the same ids as they would have without the round trip
+            for smiles in SMILES:
+                self.assertTrue(torch.equal(
+                    loaded.preprocess(smiles), saved.preprocess(smiles)))
+
+    def test_load_rejects_other_vocabulary(self):
+        with tempfile.TemporaryDirectory() as directory:
+            saved = FingerprintFromSmilePreprocessor(method='ammvf')
+            saved.preprocess('CCO')
+            saved.save_vocab(directory, 'test')
+
+            other = FingerprintFromSmilePreprocessor(method='ammvf')
+            other.preprocess('CCN')
+            self.assertFalse(other.load_vocab(directory, 'test'))
+
+    def test_load_rejects_empty_vocabulary(self):
+        with tempfile.TemporaryDirectory() as directory:
+            FingerprintFromSmilePreprocessor(
+                method='ammvf').save_vocab(directory, 'test')
+            self.assertFalse(FingerprintFromSmilePreprocessor(
+                method='ammvf').load_vocab(directory, 'test'))
+            self.assertFalse(FingerprintFromSmilePreprocessor(
+                method='ammvf').load_vocab(directory, 'missing'))
+
+
+class TestOutputDtype(unittest.TestCase):
+
+    def test_rdkit_is_float32(self):
+        fingerprint = FingerprintFromSmilePreprocessor(method='rdkit').preprocess('CCO')
+        self.assertEqual(fingerprint.dtype, torch.float32)
+        packed = FingerprintFromSmilePreprocessor(method='rdkit', pack_bits=True).preprocess('CCO')
+        self.assertTrue(torch.equal(unpack_fingerprint_bits(packed, fingerprint.numel()).float(), fingerprint))
+
+    def test_ecfp4_is_float32(self):
+        fingerprint = FingerprintFromSmilePreprocessor(method='ecfp4').preprocess('CCO')
+        self.assertEqual(fingerprint.dtype, torch.float32)
+        self.assertEqual(fingerprint.shape, (2048,))
+
+
+class TestCache(unittest.TestCase):
+
+    def test_bit_vectors_are_shared_across_spellings(self):
+        preprocessor = FingerprintFromSmilePreprocessor(method='rdkit')
+        self.assertIs(preprocessor.preprocess('CCO'), preprocessor.preprocess('OCC'))
+
+    def test_per_atom_ids_follow_the_input_order(self):
+        # 'ammvf' gives one id per atom, so another spelling of the molecule must not get the cached ids
+        preprocessor = FingerprintFromSmilePreprocessor(method='ammvf')
+        self.assertEqual(preprocessor.preprocess('CCO').tolist(), [0, 1, 2])
+        self.assertEqual(preprocessor.preprocess('OCC').tolist(), [2, 1, 0])
+
+        preprocessor = FingerprintFromSmilePreprocessor(method='ammvf', consider_hydrogen=True)
+        self.assertEqual(preprocessor.preprocess('CC(=O)O').tolist(), [0, 1, 2, 3, 4, 4, 4, 5])
+        self.assertEqual(preprocessor.preprocess('OC(C)=O').tolist(), [3, 1, 0, 2, 5, 4, 4, 4])
+
+
+    def test_cache_is_bounded(self):
+        preprocessor = FingerprintFromSmilePreprocessor(method='ammvf', cache_size=2)
+        expected = FingerprintFromSmilePreprocessor(method='ammvf').preprocess_batch_threads(SMILES * 2, 2)
+        fingerprints = preprocessor.preprocess_batch_threads(SMILES * 2, 2)
+        self.assertLessEqual(len(preprocessor._cache), 2)
+        for fingerprint, expected_fingerprint in zip(fingerprints, expected):
+            self.assertTrue(torch.equal(fingerprint, expected_fingerprint))
+
+        preprocessor = FingerprintFromSmilePreprocessor(method='rdkit', cache_size=0)
+        self.assertTrue(torch.equal(preprocessor.preprocess('CCO'), preprocessor.preprocess('CCO')))
+        self.assertEqual(len(preprocessor._cache), 0)
+
+    def test_pickled_preprocessor_has_its_own_cache(self):
+        preprocessor = FingerprintFromSmilePreprocessor(method='rdkit')
+        preprocessor.preprocess('CCO')
+        copy = pickle.loads(pickle.dumps(preprocessor))
+        self.assertEqual(len(copy._cache), 0)
+        self.assertTrue(torch.equal(copy.preprocess('CCO'), preprocessor.preprocess('CCO')))
+
+
+class TestBlobCodec(unittest.TestCase):
+
+    def test_round_trip_keeps_dtype_and_shape(self):
+        preprocessor = FingerprintFromSmilePreprocessor(
+            method='custom', custom_fingerprint=lambda mol: np.arange(9).reshape(3, 3))
+        for value in [preprocessor.preprocess('CCO'), torch.tensor(3.0),
+                      FingerprintFromSmilePreprocessor(method='rdkit', pack_bits=True).preprocess('CCO'),
+                      FingerprintFromSmilePreprocessor(method='ammvf').preprocess('CCO')]:
+            loaded = preprocessor._blob_to_value(preprocessor._value_to_blob(value))
+            self.assertEqual(loaded.dtype, value.dtype)
+            self.assertEqual(loaded.shape, value.shape)
+            self.assertTrue(torch.equal(loaded, value))
+
+
+class TestFingerprintFile(unittest.TestCase):
+
+    def test_npz_round_trip(self):
+        preprocessor = FingerprintFromSmilePreprocessor(method='ammvf')
+        data = {smiles: preprocessor.preprocess(smiles) for smiles in SMILES}
+        data['not a smiles'] = None
+
+        with tempfile.TemporaryDirectory() as directory:
+            preprocessor.save_preprocessed_to_disk(data, directory, 'test')
+            loaded = preprocessor.load_preprocessed_to_memory(
+                preprocessor.get_saved_path(directory, 'test'))
+
+        self.assertEqual(list(loaded.keys()), list(data.keys()))
+        self.assertIsNone(loaded['not a smiles'])
+        for smiles in SMILES:
+            self.assertTrue(torch.equal(loaded[smiles], data[smiles]))
+
+    def test_npz_round_trip_keeps_shapes(self):
+        preprocessor = FingerprintFromSmilePreprocessor(
+            method='custom', custom_fingerprint=lambda mol: np.arange(9).reshape(3, 3) * mol.GetNumAtoms())
+        data = {smiles: preprocessor.preprocess(smiles) for smiles in SMILES}
+        data['scalar'] = torch.tensor(1.0)
+        data['not a smiles'] = None
+
+        with tempfile.TemporaryDirectory() as directory:
+            preprocessor.save_preprocessed_to_disk(data, directory, 'test')
+            loaded = preprocessor.load_preprocessed_to_memory(
+                preprocessor.get_saved_path(directory, 'test'))
+
+        self.assertIsNone(loaded['not a smiles'])
+        for key in SMILES + ['scalar']:
+            self.assertEqual(loaded[key].shape, data[key].shape)
+            self.assertTrue(torch.equal(loaded[key], data[key]))
+
+    def test_npz_round_trip_packed_bits(self):
+        preprocessor = FingerprintFromSmilePreprocessor(
+            method='rdkit', pack_bits=True)
+        data = {smiles: preprocessor.preprocess(smiles) for smiles in SMILES}
+
+        with tempfile.TemporaryDirectory() as directory:
+            preprocessor.save_preprocessed_to_disk(data, directory, 'test')
+            loaded = preprocessor.load_preprocessed_to_memory(
+                preprocessor.get_saved_path(directory, 'test'))
+
+        for smiles in SMILES:
+            self.assertEqual(loaded[smiles].dtype, torch.uint8)
+            self.assertTrue(torch.equal(loaded[smiles], data[smiles]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import itertools
+import unittest
+
+import numpy as np
+from rdkit import Chem
+from deepdrugdomain.data.preprocessing.utils.helpers import create_atoms, create_ij_bond_dict, \
+    ij_bond_dict_to_csr, get_wl_kernel, _sort6, _KEY_PAD
+
+
+SMILES = ['CCO', 'CCN', 'OCC', 'c1ccccc1O', 'Oc1ccccc1', 'CC(=O)Nc1ccc(O)cc1',
+          'CN1C=NC2=C1C(=O)N(C(=O)N2C)C', 'C1CC2CCC1C2', 'FS(F)(F)(F)(F)F',
+          '[Re](Cl)(Cl)(Cl)(Cl)(Cl)(Cl)Cl']
+
+
+def reference_wl(atoms, ij_bond_dict, radius, node_dict, edge_dict):
+    # Plain Python Weisfeiler-Lehman refinement: a node is relabeled by (node, sorted (neighbor,
+    # edge) pairs) and an edge by (sorted (node_i, node_j), edge), each interned into an id.
+    nodes = list(atoms)
+    edges = {i: list(j_edge) for i, j_edge in ij_bond_dict.items()}
+    for _ in range(radius):
+        nodes = [node_dict.setdefault((nodes[i], tuple(sorted((nodes[j], edge) for j, edge in edges[i]))),
+                                      len(node_dict))
+                 for i in range(len(nodes))]
+        edges = {i: [(j, edge_dict.setdefault((tuple(sorted((nodes[i], nodes[j]))), edge), len(edge_dict)))
+                     for j, edge in j_edge]
+                 for i, j_edge in edges.items()}
+    return nodes
+
+
+class TestWLKernel(unittest.TestCase):
+
+    def assert_same_partition(self, radius):
+        # The kernel labels must group atoms (within and across molecules) exactly like the reference
+        atom_dict, bond_dict, node_dict, edge_dict = {}, {}, {}, {}
+        to_reference, to_kernel = {}, {}
+        kernel = get_wl_kernel(radius)
+        for smiles in SMILES:
+            mol = Chem.MolFromSmiles(smiles)
+            atoms = create_atoms(mol, atom_dict)
+            ij_bond_dict = create_ij_bond_dict(mol, bond_dict)
+            indptr, neighbors, edges = ij_bond_dict_to_csr(
+                ij_bond_dict, len(atoms))
+
+            labels, _ = kernel(atoms, indptr, neighbors, edges)
+            expected = reference_wl(
+                atoms.tolist(), ij_bond_dict, radius, node_dict, edge_dict)
+            for label, reference in zip(labels.tolist(), expected):
+                self.assertEqual(to_reference.setdefault(label, reference), reference)
+                self.assertEqual(to_kernel.setdefault(reference, label), label)
+
+    def test_radius_1(self):
+        self.assert_same_partition(1)
+
+    def test_radius_2(self):
+        self.assert_same_partition(2)
+
+    def test_radius_3(self):
+        self.assert_same_partition(3)
+
+    def test_equal_molecules_get_equal_labels(self):
+        atom_dict, bond_dict = {}, {}
+        labels = []
+        for smiles in ['CCO', 'OCC']:
+            mol = Chem.MolFromSmiles(smiles)
+            atoms = create_atoms(mol, atom_dict)
+            indptr, neighbors, edges = ij_bond_dict_to_csr(
+                create_ij_bond_dict(mol, bond_dict), len(atoms))
+            labels.append(sorted(get_wl_kernel(2)(
+                atoms, indptr, neighbors, edges)[0].tolist()))
+        self.assertEqual(labels[0], labels[1])
+
+
+class TestSortingNetwork(unittest.TestCase):
+
+    def test_sorts_all_zero_one_inputs(self):
+        # By the 0-1 principle, a network that sorts every 0/1 input sorts every input
+        for bits in itertools.product([0, 1], repeat=6):
+            keys = np.array(bits, dtype=np.uint64)
+            _sort6(keys)
+            self.assertEqual(keys.tolist(), sorted(bits))
+
+    def test_sorts_random_and_padded_keys(self):
+        rng = np.random.default_rng(0)
+        for degree in range(7):
+            for _ in range(50):
+                keys = np.full(6, _KEY_PAD, dtype=np.uint64)
+                keys[:degree] = rng.integers(
+                    0, np.iinfo(np.uint64).max, size=degree, dtype=np.uint64)
+                expected = np.sort(keys)
+                _sort6(keys)
+                self.assertTrue(np.array_equal(keys, expected))
+
+
+if __name__ == '__main__':
+    unittest.main()